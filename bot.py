@@ -58,10 +58,28 @@ def main() -> None:
         os.getenv("SPOTIFY_CLIENT_SECRET")
     )
     lyrics_service = LyricsService(os.getenv("GENIUS_API_KEY"))
-    voice_service = VoiceService(downloads_path=download_path)
+    # Voice files get their own directory, so they don't invalidate the music download index
+    voice_service = VoiceService(downloads_path=os.path.join(download_path, "voice"))
+    
+    async def post_init(application: Application) -> None:
+        # Start background work that needs the running event loop
+        await user_service.start()
+    
+    async def post_shutdown(application: Application) -> None:
+        # Write pending user changes and release shared connections held by the services
+        await user_service.close()
+        await music_service.close()
+        await spotify_service.close()
+        await voice_service.close()
     
     # Build the application
-    app = Application.builder().token(token).build()
+    app = (
+        Application.builder()
+        .token(token)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
     
     # Register command handlers with their required service instances
     register_basic_commands(app, (music_service, queue_service, user_service, lyrics_service))
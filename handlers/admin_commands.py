@@ -43,16 +43,14 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         return
     
     try:
-        # Get all users
-        users = user_service.get_all_users()
-        
-        # Calculate statistics
-        total_users = len(users)
+        # Calculate statistics, streaming users rather than loading them all at once
+        total_users = 0
         active_users_24h = 0
         active_users_7d = 0
         
         now = time.time()
-        for user in users:
+        async for user in user_service.iter_all_users(projection={"last_active": 1}):
+            total_users += 1
             last_active_timestamp = user.last_active.timestamp() if hasattr(user, "last_active") else 0
             
             if now - last_active_timestamp < 24 * 60 * 60:  # 24 hours
@@ -123,7 +121,7 @@ async def cleanup(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await update.message.reply_text(f"🧹 Cleaning up files older than {days} days...")
         
         # Run cleanup
-        count = music_service.cleanup_downloads(days)
+        count = await music_service.cleanup_downloads(days)
         
         await update.message.reply_text(f"✅ Cleanup complete. Removed {count} old files.")
     
@@ -146,7 +144,7 @@ async def broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     message = " ".join(context.args)
     
     try:
-        users = user_service.get_all_users()
+        users = await user_service.get_all_users(projection={"id": 1})
         
         await update.message.reply_text(f"📣 Broadcasting message to {len(users)} users...")
         
@@ -56,7 +56,7 @@ async def play(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     
     # Search and add to queue
     await update.message.reply_text(f"Searching for: {query}")
-    result = await music_service.play_music(query)
+    result = await music_service.play_music(chat_id, query)
     
     if not result:
         await update.message.reply_text(f'No results found for "{query}"')
@@ -122,14 +122,14 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         
         if track:
             # Add to queue
-            await music_service.add_to_queue(track)
+            await music_service.add_to_queue(chat_id, track)
             await query.edit_message_reply_markup(None)
             await context.bot.send_message(chat_id, f"Added to queue: {track.title} - {track.artist}")
         else:
             await context.bot.send_message(chat_id, "Sorry, could not find track information.")
 
 async def queue(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    queue = await music_service.get_queue()
+    queue = await music_service.get_queue(update.effective_chat.id)
     if not queue:
         await update.message.reply_text("Queue is empty")
         return
@@ -147,7 +147,7 @@ async def queue(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 async def skip(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update.effective_chat.id
     
-    result = await music_service.skip_music()
+    result = await music_service.skip_music(chat_id)
     if result:
         # Create inline keyboard with YouTube link
         keyboard = [
@@ -166,11 +166,11 @@ async def skip(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await update.message.reply_text("Nothing to play next")
 
 async def clear(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await music_service.clear_queue()
+    await music_service.clear_queue(update.effective_chat.id)
     await update.message.reply_text("Queue cleared")
 
 async def current(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    result = await music_service.current_music()
+    result = await music_service.current_music(update.effective_chat.id)
     if result:
         # Create inline keyboard with YouTube link
         keyboard = [
@@ -31,6 +31,7 @@ async def search(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await update.message.reply_text(response, reply_markup=reply_markup)
 
 async def play(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    chat_id = update.effective_chat.id
     query = ' '.join(context.args)
     if not query:
         await update.message.reply_text("Please provide a search query")
@@ -38,7 +39,7 @@ async def play(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     
     # Search and add to queue
     await update.message.reply_text(f"Searching for: {query}")
-    result = await music_service.play_music(query)
+    result = await music_service.play_music(chat_id, query)
     
     if not result:
         await update.message.reply_text(f'No results found for "{query}"')
@@ -63,25 +64,25 @@ async def play(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await update.message.reply_text("Sorry, there was an error sending the voice message.")
 
 async def pause(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if await music_service.pause_music():
+    if await music_service.pause_music(update.effective_chat.id):
         await update.message.reply_text("Music paused (queue management only)")
     else:
         await update.message.reply_text("No music is playing")
 
 async def resume(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if await music_service.resume_music():
+    if await music_service.resume_music(update.effective_chat.id):
         await update.message.reply_text("Music resumed (queue management only)")
     else:
         await update.message.reply_text("No music is paused")
 
 async def stop(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if await music_service.stop_music():
+    if await music_service.stop_music(update.effective_chat.id):
         await update.message.reply_text("Music stopped (queue management only)")
     else:
         await update.message.reply_text("No music is playing")
 
 async def skip(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    result = await music_service.skip_music()
+    result = await music_service.skip_music(update.effective_chat.id)
     if result:
         # Create inline keyboard with YouTube link
         keyboard = [
@@ -100,7 +101,7 @@ async def skip(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await update.message.reply_text("Nothing to play next")
 
 async def previous(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    result = await music_service.previous_music()
+    result = await music_service.previous_music(update.effective_chat.id)
     if result:
         # Create inline keyboard with YouTube link
         keyboard = [
@@ -119,7 +120,7 @@ async def previous(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await update.message.reply_text("Nothing to play previous")
 
 async def current(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    result = await music_service.current_music()
+    result = await music_service.current_music(update.effective_chat.id)
     if result:
         # Create inline keyboard with YouTube link
         keyboard = [
@@ -138,7 +139,7 @@ async def current(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await update.message.reply_text("No music is playing")
 
 async def queue(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    tracks = await music_service.get_queue()
+    tracks = await music_service.get_queue(update.effective_chat.id)
     if not tracks:
         await update.message.reply_text("Queue is empty")
         return
@@ -195,7 +196,7 @@ async def handle_music_callback(update: Update, context: ContextTypes.DEFAULT_TY
         
         if track:
             # Add to queue
-            await music_service.add_to_queue(track)
+            await music_service.add_to_queue(chat_id, track)
             await query.edit_message_reply_markup(None)
             await context.bot.send_message(chat_id, f"Added to queue: {track.title} - {track.artist}")
         else:
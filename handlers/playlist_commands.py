@@ -208,12 +208,8 @@ async def play_playlist(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     queue_service.clear_queue(chat_id)
     
     # Fetch all tracks and add to queue
-    tracks_added = 0
-    for track_id in playlist.tracks:
-        track = await music_service.get_track_info(track_id)
-        if track:
-            queue_service.add_to_queue(chat_id, track)
-            tracks_added += 1
+    tracks = await music_service.get_tracks_info(playlist.tracks)
+    tracks_added = queue_service.add_tracks_to_queue(chat_id, tracks)
     
     # Start playing
     next_track = queue_service.get_next_track(chat_id)
@@ -245,11 +241,8 @@ async def handle_playlist_callback(update: Update, context: ContextTypes.DEFAULT
             response += f"📝 Description: {playlist.description}\n"
         response += f"🔢 Total tracks: {len(playlist.tracks)}\n\n"
         
-        tracks = []
-        for track_id in playlist.tracks[:20]:  # Limit to 20 to avoid message too long
-            track = await music_service.get_track_info(track_id)
-            if track:
-                tracks.append(track)
+        # Limit to 20 to avoid message too long
+        tracks = await music_service.get_tracks_info(playlist.tracks[:20])
         
         if not tracks:
             response += "This playlist is empty."
@@ -297,12 +290,8 @@ async def handle_playlist_callback(update: Update, context: ContextTypes.DEFAULT
         queue_service.clear_queue(chat_id)
         
         # Fetch all tracks and add to queue
-        tracks_added = 0
-        for track_id in playlist.tracks:
-            track = await music_service.get_track_info(track_id)
-            if track:
-                queue_service.add_to_queue(chat_id, track)
-                tracks_added += 1
+        tracks = await music_service.get_tracks_info(playlist.tracks)
+        tracks_added = queue_service.add_tracks_to_queue(chat_id, tracks)
         
         # Start playing
         next_track = queue_service.get_next_track(chat_id)
@@ -328,16 +317,9 @@ async def handle_playlist_callback(update: Update, context: ContextTypes.DEFAULT
         # Clear current queue
         queue_service.clear_queue(chat_id)
         
-        # Fetch all tracks and add to queue
-        tracks_added = 0
-        
         # Convert track_ids to tracks
-        tracks_to_add = []
-        for track_id in playlist.tracks:
-            track = await music_service.get_track_info(track_id)
-            if track:
-                tracks_to_add.append(track)
-                tracks_added += 1
+        tracks_to_add = await music_service.get_tracks_info(playlist.tracks)
+        tracks_added = len(tracks_to_add)
         
         # Shuffle tracks
         import random
@@ -369,12 +351,8 @@ async def handle_playlist_callback(update: Update, context: ContextTypes.DEFAULT
             return
         
         # Fetch all tracks and add to queue
-        tracks_added = 0
-        for track_id in playlist.tracks:
-            track = await music_service.get_track_info(track_id)
-            if track:
-                queue_service.add_to_queue(chat_id, track)
-                tracks_added += 1
+        tracks = await music_service.get_tracks_info(playlist.tracks)
+        tracks_added = queue_service.add_tracks_to_queue(chat_id, tracks)
         
         await query.edit_message_text(
             f"Added {tracks_added} tracks from playlist '{playlist.name}' to the queue."
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, PrivateAttr
+from typing import List, Optional, Set
 from datetime import datetime
 import uuid
 
@@ -16,6 +16,10 @@ class Playlist(BaseModel):
     updated_at: datetime = Field(default_factory=datetime.now)
     thumbnail: Optional[str] = None
     
+    # Pending changes since the last save ("tracks:push:<id>", "tracks:pull:<id>",
+    # or "tracks" when the whole list has to be rewritten)
+    _dirty: Set[str] = PrivateAttr(default_factory=set)
+    
     def to_dict(self):
         """Convert to dictionary for storage"""
         return {
@@ -35,11 +39,26 @@ class Playlist(BaseModel):
         """Create Playlist from dictionary"""
         return Playlist(**data)
     
+    def pop_changes(self) -> Set[str]:
+        """Return the pending changes and reset them"""
+        changes = self._dirty
+        self._dirty = set()
+        return changes
+    
+    def mark_changed(self):
+        """Force the next save to rewrite the whole track list"""
+        self._dirty.add("tracks")
+    
     def add_track(self, track_id: str):
         """Add track to playlist"""
         if track_id not in self.tracks:
             self.tracks.append(track_id)
             self.updated_at = datetime.now()
+            if f"tracks:pull:{track_id}" in self._dirty:
+                # Removed and re-added: its position changed, rewrite the list
+                self._dirty.add("tracks")
+            else:
+                self._dirty.add(f"tracks:push:{track_id}")
             return True
         return False
     
@@ -48,6 +67,11 @@ class Playlist(BaseModel):
         if track_id in self.tracks:
             self.tracks.remove(track_id)
             self.updated_at = datetime.now()
+            if f"tracks:push:{track_id}" in self._dirty:
+                # Added since the last save, so nothing to pull
+                self._dirty.discard(f"tracks:push:{track_id}")
+            else:
+                self._dirty.add(f"tracks:pull:{track_id}")
             return True
         return False
     
@@ -55,6 +79,7 @@ class Playlist(BaseModel):
         """Clear all tracks from playlist"""
         self.tracks = []
         self.updated_at = datetime.now()
+        self._dirty.add("tracks")
     
     def reorder_track(self, old_position: int, new_position: int):
         """Move a track from one position to another"""
@@ -62,5 +87,6 @@ class Playlist(BaseModel):
             track = self.tracks.pop(old_position)
             self.tracks.insert(new_position, track)
             self.updated_at = datetime.now()
+            self._dirty.add("tracks")
             return True
         return False
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Any
 from datetime import datetime
 
 
@@ -16,10 +16,11 @@ class User(BaseModel):
     history: List[str] = Field(default_factory=list)  # List of track IDs
     registered_at: datetime = Field(default_factory=datetime.now)
     last_active: datetime = Field(default_factory=datetime.now)
-    settings: Dict = Field(default_factory=dict)  # User settings
+    settings: Dict[str, Any] = Field(default_factory=dict)  # User settings, always a dict
 
     def to_dict(self):
         """Convert to dictionary for storage"""
+        # Containers are copied so a saved snapshot isn't changed by later edits
         return {
             "id": self.id,
             "username": self.username,
@@ -28,11 +29,11 @@ class User(BaseModel):
             "language_code": self.language_code,
             "preferred_quality": self.preferred_quality,
             "volume": self.volume,
-            "favorite_tracks": self.favorite_tracks,
-            "history": self.history,
-            "registered_at": self.registered_at,
-            "last_active": self.last_active,
-            "settings": self.settings
+            "favorite_tracks": list(self.favorite_tracks),
+            "history": list(self.history),
+            "registered_at": self.registered_at.isoformat(),
+            "last_active": self.last_active.isoformat(),
+            "settings": dict(self.settings)
         }
     
     @staticmethod
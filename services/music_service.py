@@ -1,4 +1,7 @@
 import os
+import sys
+import json
+import tempfile
 import logging
 import asyncio
 import yt_dlp
@@ -7,9 +10,11 @@ from typing import List, Dict, Optional, Any, Tuple
 import uuid
 import re
 import random
-from pydub import AudioSegment
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from urllib.parse import urlparse, parse_qs
-import aiohttp
 
 from models.track import Track
 from utils.validators import validate_youtube_url, validate_url
@@ -17,21 +22,50 @@ from utils.formatters import clean_filename
 
 logger = logging.getLogger(__name__)
 
+
+def _extract_worker(url: str, opts: Dict[str, Any]) -> Dict[str, Any]:
+    """Extract info for a URL in a worker process (module level so it can be pickled)"""
+    with yt_dlp.YoutubeDL(opts) as ydl:
+        info = ydl.extract_info(url, download=False)
+        return ydl.sanitize_info(info)
+
+
+@dataclass
+class _ChatState:
+    """Playback state for a single chat"""
+    queue: deque = field(default_factory=deque)
+    history: deque = field(default_factory=lambda: deque(maxlen=50))  # Keep history limited to 50 items
+    current_track: Optional[Track] = None
+    is_playing: bool = False
+    is_paused: bool = False
+    volume: int = 100
+    loop_mode: str = "none"  # none, single, all
+    shuffle_mode: bool = False
+    # Play order as indices into the queue while shuffled; the queue itself
+    # stays in insertion order so shuffle can be turned off instantly
+    shuffle_order: List[int] = field(default_factory=list)
+
+
 class MusicService:
+    # Audio file extensions produced by downloads
+    _AUDIO_EXTS = ('.mp3', '.ogg', '.m4a')
+    
     def __init__(self, download_path="./downloads"):
         self.download_path = download_path
+        self._download_path_prefix = f"{download_path}/"
         if not os.path.exists(download_path):
             os.makedirs(download_path)
         
-        # Current playback state
-        self.current_track = None
-        self.queue = []
-        self.history = []
-        self.is_playing = False
-        self.is_paused = False
-        self.volume = 100
-        self.loop_mode = "none"  # none, single, all
-        self.shuffle_mode = False
+        # Playback state by chat_id
+        self._states: Dict[int, _ChatState] = defaultdict(_ChatState)
+        
+        # Worker processes for bulk metadata extraction (yt-dlp parsing holds the GIL), started on first use
+        self._proc_pool: Optional[ProcessPoolExecutor] = None
+        
+        # Downloaded files by track ID, persisted so startup doesn't re-scan the directory
+        self._index_path = self._download_path_prefix + '.index.json'
+        self._downloaded: Dict[str, str] = self._load_index()
+        self._index_lock = asyncio.Lock()
         
         # YT-DLP options
         self.ydl_opts = {
@@ -40,12 +74,73 @@ class MusicService:
             'postprocessors': [{
                 'key': 'FFmpegExtractAudio',
                 'preferredcodec': 'mp3',
-                'preferredquality': '192',
+                'preferredquality': '2',  # VBR (-q:a 2), ~190kbps average
             }],
             'quiet': True,
             'no_warnings': True,
         }
 
+    def _load_index(self) -> Dict[str, str]:
+        """Load the downloaded-files index, re-scanning the directory if it is missing or stale"""
+        try:
+            # Any file added or removed since the last write bumps the directory mtime
+            if os.stat(self._index_path).st_mtime >= os.stat(self.download_path).st_mtime:
+                with open(self._index_path) as f:
+                    return json.load(f)
+        except (OSError, ValueError):
+            pass
+        
+        index = {}
+        with os.scandir(self.download_path) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith(self._AUDIO_EXTS):
+                    index[os.path.splitext(entry.name)[0]] = entry.name
+        
+        self._write_index(index)
+        return index
+    
+    def _write_index(self, index: Dict[str, str]) -> None:
+        """Write the downloaded-files index to disk"""
+        try:
+            # Write to a temporary file and rename it, so a crash can't leave a truncated index
+            fd, temp_path = tempfile.mkstemp(prefix='.index.', suffix='.tmp', dir=self.download_path)
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(index, f)
+                os.replace(temp_path, self._index_path)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+            
+            # The rename bumps the directory mtime, so touch the index to keep it the newer of the two
+            os.utime(self._index_path)
+        except OSError as e:
+            logger.error(f"Error saving download index: {str(e)}")
+    
+    async def _persist_index(self) -> None:
+        """Write the downloaded-files index to disk without blocking the event loop"""
+        # Serialized so an older snapshot can never overwrite a newer one
+        async with self._index_lock:
+            await asyncio.to_thread(self._write_index, dict(self._downloaded))
+    
+    def _get_proc_pool(self) -> ProcessPoolExecutor:
+        """Get the metadata worker pool, creating it on first use"""
+        if self._proc_pool is None:
+            # Spawned rather than forked: the bot process has threads (motor, to_thread, aiohttp)
+            # whose held locks a forked child would inherit. Extraction is mostly network-bound,
+            # so a few workers are enough.
+            self._proc_pool = ProcessPoolExecutor(
+                max_workers=min(4, os.cpu_count() or 1),
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._proc_pool
+    
+    async def close(self) -> None:
+        """Shut down the worker processes"""
+        if self._proc_pool is not None:
+            self._proc_pool.shutdown(wait=False, cancel_futures=True)
+            self._proc_pool = None
+    
     async def search(self, query: str, max_results: int = 10) -> List[Track]:
         """Search for videos on Youtube using yt-dlp"""
         try:
@@ -101,14 +196,17 @@ class MusicService:
     async def download(self, track: Track) -> Optional[str]:
         """Stream a track and return the file path"""
         try:
+            # Check the index of previous downloads first
+            filename = self._downloaded.get(track.id)
+            if filename and os.path.exists(self._download_path_prefix + filename):
+                logger.info(f"Track already downloaded: {filename}")
+                return self._download_path_prefix + filename
+            
             # Check if already downloaded
             title_safe = clean_filename(f"{track.title}")
-            possible_paths = [
-                f"{self.download_path}/{title_safe}.mp3",
-                f"{self.download_path}/{title_safe}.ogg",
-                f"{self.download_path}/{title_safe}.m4a",
-                f"{self.download_path}/{track.id}.mp3"
-            ]
+            prefix = self._download_path_prefix
+            possible_paths = [prefix + title_safe + ext for ext in self._AUDIO_EXTS]
+            possible_paths.append(prefix + track.id + '.mp3')
             
             for path in possible_paths:
                 if os.path.exists(path):
@@ -118,6 +216,11 @@ class MusicService:
             # Download the track
             logger.info(f"Downloading track: {track.title} ({track.url})")
             
+            # Stream the audio straight into ffmpeg, without an intermediate file
+            piped_path = await self._download_piped(track)
+            if piped_path:
+                return piped_path
+            
             # Custom output template based on track ID for consistency
             custom_opts = self.ydl_opts.copy()
             custom_opts['outtmpl'] = f'{self.download_path}/{track.id}.%(ext)s'
@@ -125,17 +228,19 @@ class MusicService:
             custom_opts['postprocessors'] = [{
                 'key': 'FFmpegExtractAudio',
                 'preferredcodec': 'mp3',
-                'preferredquality': '192',
+                'preferredquality': '2',  # VBR (-q:a 2), ~190kbps average
             }]
             
             try:
                 with yt_dlp.YoutubeDL(custom_opts) as ydl:
                     info = ydl.extract_info(track.url, download=True)
                     # The file should be in the format {track.id}.mp3 after extraction
-                    expected_path = f"{self.download_path}/{track.id}.mp3"
+                    expected_path = self._download_path_prefix + track.id + '.mp3'
                     
                     if os.path.exists(expected_path):
                         logger.info(f"Successfully downloaded to {expected_path}")
+                        self._downloaded[track.id] = track.id + '.mp3'
+                        await self._persist_index()
                         return expected_path
             except Exception as e:
                 logger.error(f"Error with yt-dlp download: {str(e)}")
@@ -147,7 +252,7 @@ class MusicService:
                     'postprocessors': [{
                         'key': 'FFmpegExtractAudio',
                         'preferredcodec': 'mp3',
-                        'preferredquality': '128',
+                        'preferredquality': '5',  # VBR (-q:a 5), ~130kbps average
                     }],
                     'quiet': True,
                 }
@@ -155,17 +260,19 @@ class MusicService:
                 try:
                     with yt_dlp.YoutubeDL(fallback_opts) as ydl:
                         ydl.download([track.url])
-                        expected_path = f"{self.download_path}/{track.id}.mp3"
+                        expected_path = self._download_path_prefix + track.id + '.mp3'
                         if os.path.exists(expected_path):
                             logger.info(f"Fallback download succeeded: {expected_path}")
+                            self._downloaded[track.id] = track.id + '.mp3'
+                            await self._persist_index()
                             return expected_path
                 except Exception as fallback_error:
                     logger.error(f"Fallback download also failed: {str(fallback_error)}")
                 
             # Last resort: check if any file in the download directory contains the track ID
             for filename in os.listdir(self.download_path):
-                if filename.endswith(('.mp3', '.ogg', '.m4a')) and (track.id in filename or clean_filename(track.title) in filename.lower()):
-                    full_path = f"{self.download_path}/{filename}" 
+                if filename.endswith(self._AUDIO_EXTS) and (track.id in filename or clean_filename(track.title) in filename.lower()):
+                    full_path = self._download_path_prefix + filename
                     logger.info(f"Found matching file: {full_path}")
                     return full_path
             
@@ -176,8 +283,69 @@ class MusicService:
             logger.error(f"Error downloading '{track.title}': {str(e)}")
             return None
     
-    async def play_music(self, query: str) -> Optional[Track]:
-        """Search and play music"""
+    async def _download_piped(self, track: Track) -> Optional[str]:
+        """
+        Download a track by piping yt-dlp's raw audio stream into ffmpeg
+        Returns the file path, or None so the caller can fall back to yt-dlp's postprocessor
+        """
+        output_path = self._download_path_prefix + track.id + '.mp3'
+        part_path = output_path + '.part'
+        
+        read_fd, write_fd = os.pipe()
+        downloader = None
+        encoder = None
+        replaced = False
+        try:
+            try:
+                downloader = await asyncio.create_subprocess_exec(
+                    sys.executable, '-m', 'yt_dlp', '-f', 'bestaudio/best', '-q', '-o', '-', track.url,
+                    stdout=write_fd,
+                    stderr=asyncio.subprocess.PIPE
+                )
+                encoder = await asyncio.create_subprocess_exec(
+                    'ffmpeg', '-hide_banner', '-loglevel', 'error', '-i', 'pipe:0',
+                    '-vn', '-c:a', 'libmp3lame', '-q:a', '2', '-f', 'mp3', '-y', part_path,
+                    stdin=read_fd,
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.PIPE
+                )
+            except Exception as e:
+                logger.error(f"Error starting download pipeline: {str(e)}")
+                return None
+            finally:
+                # The children hold their own copies of the pipe ends
+                os.close(read_fd)
+                os.close(write_fd)
+            
+            (_, download_err), (_, encode_err) = await asyncio.gather(
+                downloader.communicate(), encoder.communicate()
+            )
+            
+            if downloader.returncode != 0 or encoder.returncode != 0:
+                logger.error(
+                    f"Download pipeline failed for {track.id}: "
+                    f"{download_err.decode(errors='replace')}{encode_err.decode(errors='replace')}"
+                )
+                return None
+            
+            os.replace(part_path, output_path)
+            replaced = True
+        finally:
+            # On failure or cancellation, don't leave child processes or a partial file behind
+            for process in (downloader, encoder):
+                if process is not None and process.returncode is None:
+                    process.kill()
+                    await process.wait()
+            if not replaced and os.path.exists(part_path):
+                os.remove(part_path)
+        
+        logger.info(f"Successfully downloaded to {output_path}")
+        self._downloaded[track.id] = track.id + '.mp3'
+        await self._persist_index()
+        return output_path
+    
+    async def play_music(self, chat_id: int, query: str) -> Optional[Track]:
+        """Search and play music in a chat"""
         # Search for the track
         logger.info(f"Searching for: {query}")
         results = await self.search(query)
@@ -187,142 +355,175 @@ class MusicService:
         
         logger.info(f"Found {len(results)} results, selecting first: {results[0].title}")
         track = results[0]
-        await self.add_to_queue(track)
+        await self.add_to_queue(chat_id, track)
         
         # If nothing is currently playing, start playing
-        if not self.is_playing and not self.is_paused:
-            return await self.play_next()
+        state = self._states[chat_id]
+        if not state.is_playing and not state.is_paused:
+            return await self.play_next(chat_id)
         
         return track
     
-    async def play_next(self) -> Optional[Track]:
+    async def play_next(self, chat_id: int) -> Optional[Track]:
         """Play the next track in the queue"""
-        if not self.queue:
-            self.is_playing = False
-            self.current_track = None
+        state = self._states[chat_id]
+        if not state.queue:
+            state.is_playing = False
+            state.current_track = None
             return None
         
         # Get the next track
-        track = self.queue.pop(0)
-        self.current_track = track
+        if state.shuffle_mode and state.shuffle_order:
+            index = state.shuffle_order.pop(0)
+            track = state.queue[index]
+            del state.queue[index]
+            state.shuffle_order = [i - 1 if i > index else i for i in state.shuffle_order]
+        else:
+            track = state.queue.popleft()
+        state.current_track = track
         
         # Add to history
-        if self.current_track:
-            self.history.insert(0, self.current_track)
-            # Keep history limited to 50 items
-            if len(self.history) > 50:
-                self.history = self.history[:50]
+        if state.current_track:
+            state.history.appendleft(state.current_track)
         
         # Simulate playing (in a real implementation, this would use a media player)
-        self.is_playing = True
-        self.is_paused = False
+        state.is_playing = True
+        state.is_paused = False
         
         return track
     
-    async def pause_music(self) -> bool:
+    async def pause_music(self, chat_id: int) -> bool:
         """Pause the current track"""
-        if self.is_playing and not self.is_paused:
-            self.is_paused = True
+        state = self._states[chat_id]
+        if state.is_playing and not state.is_paused:
+            state.is_paused = True
             return True
         return False
     
-    async def resume_music(self) -> bool:
+    async def resume_music(self, chat_id: int) -> bool:
         """Resume the paused track"""
-        if self.is_paused:
-            self.is_paused = False
+        state = self._states[chat_id]
+        if state.is_paused:
+            state.is_paused = False
             return True
         return False
     
-    async def stop_music(self) -> bool:
+    async def stop_music(self, chat_id: int) -> bool:
         """Stop the current playback"""
-        if self.is_playing or self.is_paused:
-            self.is_playing = False
-            self.is_paused = False
+        state = self._states[chat_id]
+        if state.is_playing or state.is_paused:
+            state.is_playing = False
+            state.is_paused = False
             return True
         return False
     
-    async def skip_music(self) -> Optional[Track]:
+    async def skip_music(self, chat_id: int) -> Optional[Track]:
         """Skip to the next track"""
-        if self.loop_mode == "single" and self.current_track:
+        state = self._states[chat_id]
+        if state.loop_mode == "single" and state.current_track:
             # When looping a single track, add it back to the queue
-            self.queue.insert(0, self.current_track)
+            self._queue_front(state, state.current_track)
         
-        return await self.play_next()
+        return await self.play_next(chat_id)
     
-    async def previous_music(self) -> Optional[Track]:
+    async def previous_music(self, chat_id: int) -> Optional[Track]:
         """Go back to the previous track"""
-        if len(self.history) < 2:  # Need at least 2 (current + previous)
+        state = self._states[chat_id]
+        if len(state.history) < 2:  # Need at least 2 (current + previous)
             return None
         
         # Current track is already in history[0], so we want history[1]
-        prev_track = self.history[1]
+        prev_track = state.history[1]
         
         # Add current track back to the beginning of the queue
-        if self.current_track:
-            self.queue.insert(0, self.current_track)
+        if state.current_track:
+            self._queue_front(state, state.current_track)
         
         # Set the previous track as current
-        self.current_track = prev_track
+        state.current_track = prev_track
         
         # Remove from history (it will be added back on next play)
-        self.history.remove(prev_track)
+        state.history.remove(prev_track)
         
-        self.is_playing = True
-        self.is_paused = False
+        state.is_playing = True
+        state.is_paused = False
         
         return prev_track
     
-    async def add_to_queue(self, track: Track) -> bool:
+    async def add_to_queue(self, chat_id: int, track: Track) -> bool:
         """Add a track to the queue"""
-        self.queue.append(track)
+        state = self._states[chat_id]
+        state.queue.append(track)
+        if state.shuffle_mode:
+            # Slot the new track into a random position of the play order
+            state.shuffle_order.insert(random.randint(0, len(state.shuffle_order)), len(state.queue) - 1)
         return True
     
-    async def clear_queue(self) -> bool:
+    @staticmethod
+    def _queue_front(state: "_ChatState", track: Track) -> None:
+        """Put a track at the front of the queue so it plays next"""
+        state.queue.appendleft(track)
+        if state.shuffle_mode:
+            state.shuffle_order = [0] + [i + 1 for i in state.shuffle_order]
+    
+    async def clear_queue(self, chat_id: int) -> bool:
         """Clear the playback queue"""
-        self.queue = []
+        state = self._states[chat_id]
+        state.queue.clear()
+        state.shuffle_order = []
         return True
     
-    async def get_queue(self) -> List[Track]:
-        """Get the current queue"""
-        return self.queue
+    async def get_queue(self, chat_id: int) -> List[Track]:
+        """Get the current queue in play order"""
+        state = self._states[chat_id]
+        items = list(state.queue)
+        if state.shuffle_mode:
+            return [items[i] for i in state.shuffle_order]
+        return items
     
-    async def get_history(self) -> List[Track]:
+    async def get_history(self, chat_id: int) -> List[Track]:
         """Get the playback history"""
-        return self.history
+        return list(self._states[chat_id].history)
     
-    async def current_music(self) -> Optional[Track]:
+    async def current_music(self, chat_id: int) -> Optional[Track]:
         """Get the currently playing track"""
-        return self.current_track
+        return self._states[chat_id].current_track
     
-    async def set_volume(self, volume: int) -> int:
+    async def set_volume(self, chat_id: int, volume: int) -> int:
         """Set the playback volume (0-100)"""
-        self.volume = max(0, min(100, volume))
-        return self.volume
+        state = self._states[chat_id]
+        state.volume = max(0, min(100, volume))
+        return state.volume
     
-    async def get_volume(self) -> int:
+    async def get_volume(self, chat_id: int) -> int:
         """Get the current volume"""
-        return self.volume
+        return self._states[chat_id].volume
     
-    async def toggle_loop(self) -> str:
+    async def toggle_loop(self, chat_id: int) -> str:
         """Toggle loop mode (none -> single -> all -> none)"""
-        if self.loop_mode == "none":
-            self.loop_mode = "single"
-        elif self.loop_mode == "single":
-            self.loop_mode = "all"
+        state = self._states[chat_id]
+        if state.loop_mode == "none":
+            state.loop_mode = "single"
+        elif state.loop_mode == "single":
+            state.loop_mode = "all"
         else:
-            self.loop_mode = "none"
+            state.loop_mode = "none"
         
-        return self.loop_mode
+        return state.loop_mode
     
-    async def toggle_shuffle(self) -> bool:
+    async def toggle_shuffle(self, chat_id: int) -> bool:
         """Toggle shuffle mode"""
-        self.shuffle_mode = not self.shuffle_mode
+        state = self._states[chat_id]
+        state.shuffle_mode = not state.shuffle_mode
         
-        if self.shuffle_mode:
-            # Shuffle the current queue
-            random.shuffle(self.queue)
+        if state.shuffle_mode:
+            # Shuffle the play order, leaving the queue itself untouched
+            state.shuffle_order = list(range(len(state.queue)))
+            random.shuffle(state.shuffle_order)
+        else:
+            state.shuffle_order = []
         
-        return self.shuffle_mode
+        return state.shuffle_mode
     
     async def get_lyrics(self, track: Optional[Track] = None) -> Optional[str]:
         """Get lyrics for a track (placeholder - implemented in LyricsService)"""
@@ -373,7 +574,58 @@ class MusicService:
             logger.error(f"Error getting track info for '{track_id}': {str(e)}")
             return None
     
-    def cleanup_downloads(self, max_age_days: int = 7) -> int:
+    async def get_tracks_info(self, track_ids: List[str]) -> List[Track]:
+        """Get info about many tracks at once, extracting them in parallel worker processes"""
+        if not track_ids:
+            return []
+        
+        loop = asyncio.get_running_loop()
+        proc_pool = self._get_proc_pool()
+        opts = {'quiet': True, 'extract_flat': True}
+        results = await asyncio.gather(*(
+            loop.run_in_executor(
+                proc_pool, _extract_worker, f"https://www.youtube.com/watch?v={track_id}", opts
+            )
+            for track_id in track_ids
+        ), return_exceptions=True)
+        
+        tracks = []
+        for track_id, info in zip(track_ids, results):
+            url = f"https://www.youtube.com/watch?v={track_id}"
+            thumbnail = f"https://i.ytimg.com/vi/{track_id}/hqdefault.jpg"
+            
+            error = info if isinstance(info, BaseException) else None
+            if error is None:
+                try:
+                    tracks.append(Track(
+                        id=info['id'],
+                        title=info['title'],
+                        artist=info.get('uploader', 'Unknown'),
+                        url=url,
+                        thumbnail=thumbnail,
+                        duration=info.get('duration'),
+                        source="youtube"
+                    ))
+                except Exception as e:
+                    error = e
+            
+            if error is not None:
+                logger.error(f"Error getting track info for '{track_id}': {str(error)}")
+                
+                # Fallback: Create a minimal track with just the ID and URL
+                tracks.append(Track(
+                    id=track_id,
+                    title=f"YouTube Video {track_id}",
+                    artist="Unknown",
+                    url=url,
+                    thumbnail=thumbnail,
+                    duration=0,
+                    source="youtube"
+                ))
+        
+        return tracks
+    
+    async def cleanup_downloads(self, max_age_days: int = 7) -> int:
         """
         Clean up old downloads to save disk space
         Returns the number of files removed
@@ -388,18 +640,24 @@ class MusicService:
         cutoff = now - (max_age_days * 24 * 60 * 60)
         
         try:
-            for filename in os.listdir(self.download_path):
-                file_path = os.path.join(self.download_path, filename)
-                
-                # Skip directories and non-audio files
-                if os.path.isdir(file_path) or not filename.endswith(('.mp3', '.ogg', '.m4a')):
-                    continue
-                
-                # Check file age
-                if os.path.getmtime(file_path) < cutoff:
-                    os.remove(file_path)
-                    count += 1
-                    logger.info(f"Removed old file: {filename}")
+            # Includes subdirectories, such as the one VoiceService writes into
+            for dirpath, dirnames, filenames in os.walk(self.download_path):
+                for filename in filenames:
+                    # Skip non-audio files
+                    if not filename.endswith(self._AUDIO_EXTS):
+                        continue
+                    
+                    # Check file age
+                    file_path = os.path.join(dirpath, filename)
+                    if os.path.getmtime(file_path) < cutoff:
+                        os.remove(file_path)
+                        if dirpath == self.download_path:
+                            self._downloaded.pop(os.path.splitext(filename)[0], None)
+                        count += 1
+                        logger.info(f"Removed old file: {filename}")
+            
+            if count:
+                await self._persist_index()
             
             return count
         
@@ -70,10 +70,17 @@ class PlaylistService:
     
     def _save_playlist(self, playlist: Playlist) -> bool:
         """Save a playlist to MongoDB"""
-        if not self.db:
+        if self.db is None:
+            # Nothing to write to, so there is no delta to keep either
+            playlist.pop_changes()
             return False
         
+        changes = playlist.pop_changes()
         try:
+            # Only send the track delta when the list was appended to or pulled from
+            if changes and self._save_track_changes(playlist, changes):
+                return True
+            
             playlist_dict = playlist.to_dict()
             
             # Ensure datetime objects are serialized properly
@@ -89,8 +96,38 @@ class PlaylistService:
             return True
         except Exception as e:
             logger.error(f"Error saving playlist {playlist.id}: {str(e)}")
+            # The track delta wasn't written, so rewrite the full list next time
+            playlist.mark_changed()
             return False
     
+    def _save_track_changes(self, playlist: Playlist, changes: set) -> bool:
+        """
+        Apply pending track pushes/pulls with $push/$pull instead of rewriting the document
+        Returns False if a full save is needed instead
+        """
+        if "tracks" in changes:
+            return False
+        
+        pushed = [c.split(":", 2)[2] for c in changes if c.startswith("tracks:push:")]
+        pulled = [c.split(":", 2)[2] for c in changes if c.startswith("tracks:pull:")]
+        
+        # MongoDB can't $push and $pull the same field in one update
+        if pushed and pulled:
+            return False
+        
+        update = {"$set": {"updated_at": playlist.updated_at.isoformat()}}
+        if pushed:
+            # Keep the in-memory order of the newly appended tracks
+            pushed.sort(key=playlist.tracks.index)
+            update["$push"] = {"tracks": {"$each": pushed}}
+        elif pulled:
+            update["$pull"] = {"tracks": {"$in": pulled}}
+        
+        result = self.db.playlists.update_one({"id": playlist.id}, update)
+        
+        # Document missing from the database, fall back to a full upsert
+        return result.matched_count > 0
+    
     def get_user_playlists(self, user_id: int) -> List[Playlist]:
         """Get all playlists owned by a user"""
         if not self.db:
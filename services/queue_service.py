@@ -1,6 +1,8 @@
 import logging
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Deque
 import random
+from collections import deque
+from itertools import islice
 from models.track import Track
 
 logger = logging.getLogger(__name__)
@@ -8,82 +10,82 @@ logger = logging.getLogger(__name__)
 class QueueService:
     def __init__(self):
         # Queue data by chat_id
-        self.queues: Dict[int, List[Track]] = {}
+        self.queues: Dict[int, Deque[Track]] = {}
         self.current_tracks: Dict[int, Optional[Track]] = {}
-        self.history: Dict[int, List[Track]] = {}
+        self.history: Dict[int, Deque[Track]] = {}
         self.loop_modes: Dict[int, str] = {}  # none, single, all
         self.shuffle_modes: Dict[int, bool] = {}
     
     def get_queue(self, chat_id: int) -> List[Track]:
         """Get the queue for a specific chat"""
-        return self.queues.get(chat_id, [])
+        return list(self.queues.get(chat_id, ()))
     
     def add_to_queue(self, chat_id: int, track: Track) -> bool:
         """Add a track to the queue for a specific chat"""
-        if chat_id not in self.queues:
-            self.queues[chat_id] = []
-        
-        self.queues[chat_id].append(track)
+        self.queues.setdefault(chat_id, deque()).append(track)
         return True
     
     def add_tracks_to_queue(self, chat_id: int, tracks: List[Track]) -> int:
         """Add multiple tracks to the queue and return the number added"""
-        if chat_id not in self.queues:
-            self.queues[chat_id] = []
-        
-        self.queues[chat_id].extend(tracks)
+        self.queues.setdefault(chat_id, deque()).extend(tracks)
         return len(tracks)
     
     def clear_queue(self, chat_id: int) -> bool:
         """Clear the queue for a specific chat"""
-        self.queues[chat_id] = []
+        self.queues[chat_id] = deque()
         return True
     
     def remove_from_queue(self, chat_id: int, index: int) -> Optional[Track]:
         """Remove a track at a specific index from the queue"""
-        if chat_id not in self.queues or index >= len(self.queues[chat_id]) or index < 0:
+        queue = self.queues.get(chat_id)
+        if not queue or index >= len(queue) or index < 0:
             return None
         
-        return self.queues[chat_id].pop(index)
+        track = queue[index]
+        del queue[index]
+        return track
     
     def move_in_queue(self, chat_id: int, old_index: int, new_index: int) -> bool:
         """Move a track from one position to another in the queue"""
-        if chat_id not in self.queues:
+        queue = self.queues.get(chat_id)
+        if not queue:
             return False
         
-        queue = self.queues[chat_id]
         if old_index < 0 or old_index >= len(queue) or new_index < 0 or new_index >= len(queue):
             return False
         
-        track = queue.pop(old_index)
+        track = queue[old_index]
+        del queue[old_index]
         queue.insert(new_index, track)
         return True
     
     def get_next_track(self, chat_id: int) -> Optional[Track]:
         """Get the next track from the queue, considering loop and shuffle settings"""
-        if chat_id not in self.queues or not self.queues[chat_id]:
+        queue = self.queues.get(chat_id)
+        if not queue:
             return None
         
         # Handle single track loop
-        loop_mode = self.get_loop_mode(chat_id)
-        if loop_mode == "single" and chat_id in self.current_tracks and self.current_tracks[chat_id]:
+        loop_mode = self.loop_modes.get(chat_id, "none")
+        current_track = self.current_tracks.get(chat_id)
+        if loop_mode == "single" and current_track:
             # Return the current track again
-            return self.current_tracks[chat_id]
+            return current_track
         
         # Get and remove the next track from the queue
-        next_track = self.queues[chat_id].pop(0)
+        next_track = queue.popleft()
         
         # Add current track to history
-        if chat_id in self.current_tracks and self.current_tracks[chat_id]:
-            self._add_to_history(chat_id, self.current_tracks[chat_id])
+        if current_track:
+            self._add_to_history(chat_id, current_track)
         
         # Set as current track
         self.current_tracks[chat_id] = next_track
         
         # Handle queue looping
-        if loop_mode == "all" and next_track:
+        if loop_mode == "all":
             # Add the track back to the end of the queue
-            self.queues[chat_id].append(next_track)
+            queue.append(next_track)
         
         return next_track
     
@@ -93,48 +95,46 @@ class QueueService:
     
     def get_history(self, chat_id: int, limit: int = 10) -> List[Track]:
         """Get the playback history for a chat"""
-        history = self.history.get(chat_id, [])
-        return history[:limit]
+        history = self.history.get(chat_id, ())
+        return list(islice(history, 0, limit))
     
     def _add_to_history(self, chat_id: int, track: Track, max_history: int = 50) -> None:
         """Add a track to the history for a chat"""
-        if chat_id not in self.history:
-            self.history[chat_id] = []
+        history = self.history.get(chat_id)
+        if history is None:
+            # Bounded, so the oldest entries drop off automatically
+            history = self.history[chat_id] = deque(maxlen=max_history)
         
         # Add to the beginning of history
-        self.history[chat_id].insert(0, track)
-        
-        # Trim history if needed
-        if len(self.history[chat_id]) > max_history:
-            self.history[chat_id] = self.history[chat_id][:max_history]
+        history.appendleft(track)
     
     def get_previous_track(self, chat_id: int) -> Optional[Track]:
         """Get the previous track from history"""
-        if chat_id not in self.history or len(self.history[chat_id]) < 1:
+        history = self.history.get(chat_id)
+        if not history:
             return None
         
-        # Get the previous track (index 0 is the current track)
-        if len(self.history[chat_id]) > 1:
-            prev_track = self.history[chat_id][1]
+        # Get the previous track (index 0 is the current track) and remove it from history
+        if len(history) > 1:
+            prev_track = history[1]
+            del history[1]
         else:
-            prev_track = self.history[chat_id][0]
+            prev_track = history.popleft()
         
         # Add current track back to the beginning of queue
-        if chat_id in self.current_tracks and self.current_tracks[chat_id]:
-            if chat_id not in self.queues:
-                self.queues[chat_id] = []
-            
-            self.queues[chat_id].insert(0, self.current_tracks[chat_id])
+        self._requeue_current(chat_id)
         
         # Set previous track as current
         self.current_tracks[chat_id] = prev_track
         
-        # Remove from history
-        if prev_track in self.history[chat_id]:
-            self.history[chat_id].remove(prev_track)
-        
         return prev_track
     
+    def _requeue_current(self, chat_id: int) -> None:
+        """Put the current track back at the front of the queue"""
+        current_track = self.current_tracks.get(chat_id)
+        if current_track:
+            self.queues.setdefault(chat_id, deque()).appendleft(current_track)
+    
     def set_loop_mode(self, chat_id: int, mode: str) -> str:
         """Set the loop mode for a chat (none, single, all)"""
         if mode not in ["none", "single", "all"]:
@@ -163,8 +163,12 @@ class QueueService:
         self.shuffle_modes[chat_id] = enabled
         
         # Shuffle the queue if enabled
-        if enabled and chat_id in self.queues:
-            random.shuffle(self.queues[chat_id])
+        queue = self.queues.get(chat_id)
+        if enabled and queue:
+            # Shuffling a deque in place indexes into its middle, which is O(n) per swap
+            items = list(queue)
+            random.shuffle(items)
+            self.queues[chat_id] = deque(items)
         
         return enabled
     
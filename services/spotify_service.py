@@ -1,67 +1,228 @@
 import logging
 import os
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
+import aiohttp
 from typing import List, Dict, Optional, Any, Tuple
 import asyncio
+import functools
 import re
+import time
+from collections import OrderedDict
 
 from models.track import Track
 from utils.validators import validate_spotify_url
 
 logger = logging.getLogger(__name__)
 
+API_BASE_URL = "https://api.spotify.com/v1"
+TOKEN_URL = "https://accounts.spotify.com/api/token"
+
+# Fields requested for each playlist item
+PLAYLIST_ITEM_FIELDS = 'items.track.id,items.track.name,items.track.artists,items.track.album,items.track.external_urls,items.track.duration_ms,total'
+
 class SpotifyService:
     def __init__(self, client_id: Optional[str] = None, client_secret: Optional[str] = None):
         """Initialize the Spotify service with client credentials"""
         self.client_id = client_id or os.getenv("SPOTIFY_CLIENT_ID")
         self.client_secret = client_secret or os.getenv("SPOTIFY_CLIENT_SECRET")
-        self.spotify = None
-        
-        # Initialize Spotify client if credentials are available
-        if self.client_id and self.client_secret:
-            try:
-                client_credentials_manager = SpotifyClientCredentials(
-                    client_id=self.client_id, 
-                    client_secret=self.client_secret
-                )
-                self.spotify = spotipy.Spotify(client_credentials_manager=client_credentials_manager)
-                logger.info("Initialized Spotify API client")
-            except Exception as e:
-                logger.error(f"Error initializing Spotify API: {str(e)}")
+        # Requesting a market drops the large available_markets list from album track objects
+        self.market = os.getenv("SPOTIFY_MARKET", "US")
+        self.enabled = bool(self.client_id and self.client_secret)
+        
+        # LRU caches of API results: tracks by ID, playlist/album track lists by (type, ID) with a TTL
+        self._track_cache: "OrderedDict[str, Track]" = OrderedDict()
+        self._track_cache_size = 512
+        self._tracks_cache: "OrderedDict[Tuple[str, str], Tuple[float, List[Track]]]" = OrderedDict()
+        self._tracks_cache_size = 64
+        self._tracks_cache_ttl = 600  # seconds
+        self._search_cache: "OrderedDict[Tuple[str, int], Tuple[float, List[Track]]]" = OrderedDict()
+        self._search_cache_size = 256
+        self._search_cache_ttl = 300  # seconds
+        self._search_pending: Dict[Tuple[str, int], asyncio.Future] = {}
+        
+        # Shared HTTP session and client-credentials access token, created on first use
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._token: Optional[str] = None
+        self._token_expires_at = 0.0
+        self._token_lock: Optional[asyncio.Lock] = None
+        self._max_retry_after = 5  # seconds
+        
+        if self.enabled:
+            logger.info("Initialized Spotify API client")
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Get the shared HTTP session, creating it on first use"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=50, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+    
+    async def close(self) -> None:
+        """Close the shared HTTP session"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+    
+    async def _get_token(self) -> str:
+        """Get an access token using the client credentials flow, refreshing it shortly before it expires"""
+        if self._token_lock is None:
+            self._token_lock = asyncio.Lock()
+        
+        async with self._token_lock:
+            if self._token and time.monotonic() < self._token_expires_at:
+                return self._token
+            
+            session = await self._get_session()
+            async with session.post(
+                TOKEN_URL,
+                data={"grant_type": "client_credentials"},
+                auth=aiohttp.BasicAuth(self.client_id, self.client_secret)
+            ) as response:
+                response.raise_for_status()
+                data = await response.json()
+            
+            self._token = data["access_token"]
+            self._token_expires_at = time.monotonic() + data["expires_in"] - 60
+            return self._token
+    
+    async def _request(self, path: str, **params) -> Dict[str, Any]:
+        """Make a GET request to the Spotify Web API and return the decoded JSON"""
+        session = await self._get_session()
+        params = {key: value for key, value in params.items() if value is not None}
+        
+        retried_auth = False
+        retried_rate_limit = False
+        while True:
+            token = await self._get_token()
+            async with session.get(
+                f"{API_BASE_URL}/{path}",
+                params=params,
+                headers={"Authorization": f"Bearer {token}"}
+            ) as response:
+                if response.status == 401 and not retried_auth:
+                    # Token was revoked or expired early, get a new one and retry once
+                    retried_auth = True
+                    self._token = None
+                    continue
+                
+                retry_after = int(response.headers.get("Retry-After", 1)) if response.status == 429 else None
+                
+                # Only wait out a short rate limit, once, rather than stall a user-facing command
+                if retry_after is None or retried_rate_limit or retry_after > self._max_retry_after:
+                    response.raise_for_status()
+                    return await response.json()
+            
+            retried_rate_limit = True
+            await asyncio.sleep(retry_after)
+    
+    @staticmethod
+    def _track_from_api(item: Dict[str, Any], thumbnail: Optional[str] = None) -> Track:
+        """Build a Track from a Spotify API track object, using its album image unless a thumbnail is given"""
+        if thumbnail is None:
+            album = item.get('album')
+            thumbnail = album['images'][0]['url'] if album and album['images'] else None
+        
+        # The API data is already well-typed, so skip pydantic validation
+        return Track.model_construct(
+            id=item['id'],
+            title=item['name'],
+            artist=', '.join(artist['name'] for artist in item['artists']),
+            url=item['external_urls']['spotify'],
+            thumbnail=thumbnail,
+            duration=item['duration_ms'] // 1000,  # Convert ms to seconds
+            source="spotify"
+        )
+    
+    @staticmethod
+    def _get_cached_tracks(cache: OrderedDict, key: Tuple) -> Optional[List[Track]]:
+        """Get a cached track list if it hasn't expired"""
+        entry = cache.get(key)
+        if entry is None:
+            return None
+        
+        expires_at, tracks = entry
+        if time.monotonic() > expires_at:
+            del cache[key]
+            return None
+        
+        cache.move_to_end(key)
+        return list(tracks)
+    
+    @staticmethod
+    def _cache_tracks(cache: OrderedDict, key: Tuple, tracks: List[Track], max_size: int, ttl: float) -> None:
+        """Cache a track list, evicting the least recently used entry if full"""
+        cache[key] = (time.monotonic() + ttl, list(tracks))
+        cache.move_to_end(key)
+        if len(cache) > max_size:
+            cache.popitem(last=False)
+    
+    async def _fetch_all_pages(self, fetch_page, limit: int, parse_page, first_page: Optional[Dict[str, Any]] = None) -> List[Track]:
+        """Fetch every page of a paged Spotify endpoint, parsing each page while later ones are still in flight"""
+        # The first batch tells us the total, the rest can be fetched concurrently
+        results = first_page
+        if results is None:
+            results = await fetch_page(offset=0)
+        
+        # Cap requests in flight, so large playlists don't run into Spotify's rate limit
+        semaphore = asyncio.Semaphore(6)
+        
+        async def fetch_limited(offset: int) -> Dict[str, Any]:
+            async with semaphore:
+                return await fetch_page(offset=offset)
+        
+        pending = [
+            asyncio.ensure_future(fetch_limited(offset))
+            for offset in range(limit, results['total'], limit)
+        ]
+        
+        tracks = []
+        try:
+            tracks.extend(parse_page(results))
+            for page in pending:
+                tracks.extend(parse_page(await page))
+        finally:
+            # Don't leave failed requests unretrieved if an earlier page failed
+            for page in pending:
+                page.cancel()
+        
+        return tracks
     
     async def search_track(self, query: str, limit: int = 10) -> List[Track]:
         """Search for tracks on Spotify"""
-        if not self.spotify:
+        if not self.enabled:
             logger.warning("Spotify API not initialized")
             return []
         
+        key = (query.lower().strip(), limit)
+        cached = self._get_cached_tracks(self._search_cache, key)
+        if cached is not None:
+            return cached
+        
+        # Share the result of an identical search that is already running
+        pending = self._search_pending.get(key)
+        if pending:
+            return list(await asyncio.shield(pending))
+        
+        future = asyncio.get_running_loop().create_future()
+        self._search_pending[key] = future
+        tracks = []
         try:
-            # Execute in a thread pool to avoid blocking
-            loop = asyncio.get_event_loop()
-            results = await loop.run_in_executor(
-                None, 
-                lambda: self.spotify.search(q=query, type='track', limit=limit)
-            )
-            
-            tracks = []
-            for item in results['tracks']['items']:
-                # Format artist names
-                artists = [artist['name'] for artist in item['artists']]
-                artist_str = ', '.join(artists)
-                
-                track = Track(
-                    id=item['id'],
-                    title=item['name'],
-                    artist=artist_str,
-                    url=item['external_urls']['spotify'],
-                    thumbnail=item['album']['images'][0]['url'] if item['album']['images'] else None,
-                    duration=item['duration_ms'] // 1000,  # Convert ms to seconds
-                    source="spotify"
+            tracks = await self._search_track(query, limit)
+            if tracks:
+                self._cache_tracks(
+                    self._search_cache, key, tracks, self._search_cache_size, self._search_cache_ttl
                 )
-                tracks.append(track)
+        finally:
+            del self._search_pending[key]
+            future.set_result(tracks)
+        
+        return tracks
+    
+    async def _search_track(self, query: str, limit: int) -> List[Track]:
+        """Search for tracks on Spotify, bypassing the cache"""
+        try:
+            results = await self._request("search", q=query, type='track', limit=limit)
             
-            return tracks
+            return [self._track_from_api(item) for item in results['tracks']['items']]
         
         except Exception as e:
             logger.error(f"Error searching Spotify for '{query}': {str(e)}")
@@ -69,7 +230,7 @@ class SpotifyService:
     
     async def get_track_by_url(self, url: str) -> Optional[Track]:
         """Get track info from a Spotify URL"""
-        if not self.spotify:
+        if not self.enabled:
             logger.warning("Spotify API not initialized")
             return None
         
@@ -81,26 +242,20 @@ class SpotifyService:
                 logger.warning(f"Invalid Spotify track URL: {url}")
                 return None
             
+            # Check the cache first
+            track = self._track_cache.get(content_id)
+            if track:
+                self._track_cache.move_to_end(content_id)
+                return track
+            
             # Get track info
-            loop = asyncio.get_event_loop()
-            track_info = await loop.run_in_executor(
-                None,
-                lambda: self.spotify.track(content_id)
-            )
+            track_info = await self._request(f"tracks/{content_id}")
             
-            # Format artist names
-            artists = [artist['name'] for artist in track_info['artists']]
-            artist_str = ', '.join(artists)
-            
-            track = Track(
-                id=track_info['id'],
-                title=track_info['name'],
-                artist=artist_str,
-                url=track_info['external_urls']['spotify'],
-                thumbnail=track_info['album']['images'][0]['url'] if track_info['album']['images'] else None,
-                duration=track_info['duration_ms'] // 1000,  # Convert ms to seconds
-                source="spotify"
-            )
+            track = self._track_from_api(track_info)
+            
+            self._track_cache[content_id] = track
+            if len(self._track_cache) > self._track_cache_size:
+                self._track_cache.popitem(last=False)
             
             return track
         
@@ -110,7 +265,7 @@ class SpotifyService:
     
     async def get_playlist_tracks(self, playlist_url: str) -> List[Track]:
         """Get all tracks from a Spotify playlist"""
-        if not self.spotify:
+        if not self.enabled:
             logger.warning("Spotify API not initialized")
             return []
         
@@ -122,57 +277,27 @@ class SpotifyService:
                 logger.warning(f"Invalid Spotify playlist URL: {playlist_url}")
                 return []
             
+            cached = self._get_cached_tracks(self._tracks_cache, ('playlist', content_id))
+            if cached is not None:
+                return cached
+            
             # Get playlist tracks
-            tracks = []
-            offset = 0
             limit = 100  # Spotify API limit
+            fetch_page = functools.partial(
+                self._request,
+                f"playlists/{content_id}/tracks",
+                limit=limit,
+                fields=PLAYLIST_ITEM_FIELDS
+            )
+            tracks = await self._fetch_all_pages(
+                fetch_page,
+                limit,
+                lambda results: [self._track_from_api(item['track']) for item in results['items'] if item['track']]
+            )
             
-            loop = asyncio.get_event_loop()
-            
-            while True:
-                # Get a batch of tracks
-                results = await loop.run_in_executor(
-                    None,
-                    lambda: self.spotify.playlist_items(
-                        content_id,
-                        offset=offset,
-                        limit=limit,
-                        fields='items.track.id,items.track.name,items.track.artists,items.track.album,items.track.external_urls,items.track.duration_ms,total'
-                    )
-                )
-                
-                # Process tracks
-                for item in results['items']:
-                    if not item['track']:
-                        continue
-                    
-                    track_info = item['track']
-                    
-                    # Format artist names
-                    artists = [artist['name'] for artist in track_info['artists']]
-                    artist_str = ', '.join(artists)
-                    
-                    # Get album image if available
-                    thumbnail = None
-                    if track_info['album'] and track_info['album']['images']:
-                        thumbnail = track_info['album']['images'][0]['url']
-                    
-                    track = Track(
-                        id=track_info['id'],
-                        title=track_info['name'],
-                        artist=artist_str,
-                        url=track_info['external_urls']['spotify'],
-                        thumbnail=thumbnail,
-                        duration=track_info['duration_ms'] // 1000,  # Convert ms to seconds
-                        source="spotify"
-                    )
-                    tracks.append(track)
-                
-                # Check if we need to fetch more
-                offset += limit
-                if offset >= results['total']:
-                    break
-            
+            self._cache_tracks(
+                self._tracks_cache, ('playlist', content_id), tracks, self._tracks_cache_size, self._tracks_cache_ttl
+            )
             return tracks
         
         except Exception as e:
@@ -181,7 +306,7 @@ class SpotifyService:
     
     async def get_album_tracks(self, album_url: str) -> List[Track]:
         """Get all tracks from a Spotify album"""
-        if not self.spotify:
+        if not self.enabled:
             logger.warning("Spotify API not initialized")
             return []
         
@@ -193,54 +318,29 @@ class SpotifyService:
                 logger.warning(f"Invalid Spotify album URL: {album_url}")
                 return []
             
-            # Get album info (to get thumbnail)
-            loop = asyncio.get_event_loop()
-            album_info = await loop.run_in_executor(
-                None,
-                lambda: self.spotify.album(content_id)
-            )
+            cached = self._get_cached_tracks(self._tracks_cache, ('album', content_id))
+            if cached is not None:
+                return cached
+            
+            # Get album info (to get thumbnail), which also includes the first page of tracks
+            album_info = await self._request(f"albums/{content_id}", market=self.market)
             
             thumbnail = album_info['images'][0]['url'] if album_info['images'] else None
             album_name = album_info['name']
             
             # Get album tracks
-            tracks = []
-            offset = 0
             limit = 50  # Spotify API limit
+            fetch_page = functools.partial(self._request, f"albums/{content_id}/tracks", limit=limit, market=self.market)
+            tracks = await self._fetch_all_pages(
+                fetch_page,
+                limit,
+                lambda results: [self._track_from_api(track_info, thumbnail) for track_info in results['items']],
+                first_page=album_info['tracks']
+            )
             
-            while True:
-                # Get a batch of tracks
-                results = await loop.run_in_executor(
-                    None,
-                    lambda: self.spotify.album_tracks(
-                        content_id,
-                        offset=offset,
-                        limit=limit
-                    )
-                )
-                
-                # Process tracks
-                for track_info in results['items']:
-                    # Format artist names
-                    artists = [artist['name'] for artist in track_info['artists']]
-                    artist_str = ', '.join(artists)
-                    
-                    track = Track(
-                        id=track_info['id'],
-                        title=track_info['name'],
-                        artist=artist_str,
-                        url=f"https://open.spotify.com/track/{track_info['id']}",
-                        thumbnail=thumbnail,
-                        duration=track_info['duration_ms'] // 1000,  # Convert ms to seconds
-                        source="spotify"
-                    )
-                    tracks.append(track)
-                
-                # Check if we need to fetch more
-                offset += limit
-                if offset >= results['total']:
-                    break
-            
+            self._cache_tracks(
+                self._tracks_cache, ('album', content_id), tracks, self._tracks_cache_size, self._tracks_cache_ttl
+            )
             return tracks
         
         except Exception as e:
@@ -1,9 +1,12 @@
 import logging
 import os
 import json
-import pymongo
-from typing import Dict, List, Optional, Any
-from datetime import datetime
+import asyncio
+from collections import OrderedDict
+from itertools import islice
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, UpdateOne
+from typing import AsyncIterator, Dict, List, Optional, Any, Set, Tuple
 from models.user import User
 from models.track import Track
 
@@ -12,158 +15,281 @@ logger = logging.getLogger(__name__)
 class UserService:
     def __init__(self, mongodb_uri: Optional[str] = None):
         """Initialize the user service with optional MongoDB connection"""
-        self.users: Dict[int, User] = {}  # In-memory users cache
+        self.users: "OrderedDict[int, User]" = OrderedDict()  # In-memory LRU users cache
+        self._max_cached_users = 10_000
         self.mongodb_uri = mongodb_uri or os.getenv("MONGODB_URI")
         self.db = None
         
+        # Users with changes not yet written to MongoDB, flushed in batches
+        self._dirty: Set[int] = set()
+        self._flushing: Set[int] = set()  # Taken out of _dirty while their bulk_write is in flight
+        self._flush_interval = 2  # seconds
+        self._flush_task: Optional[asyncio.Task] = None
+        self._stop_flushing: Optional[asyncio.Event] = None
+        
+        # Last document written for each user, so saves only send changed fields
+        self._last_saved: Dict[int, Dict[str, Any]] = {}
+        
         # Try to connect to MongoDB if URI is provided
         if self.mongodb_uri:
             try:
-                self.client = pymongo.MongoClient(self.mongodb_uri)
+                self.client = AsyncIOMotorClient(self.mongodb_uri)
                 self.db = self.client.mastermusic
                 logger.info("Connected to MongoDB")
             except Exception as e:
                 logger.error(f"Error connecting to MongoDB: {str(e)}")
     
-    def get_user(self, user_id: int) -> User:
+    async def get_user(self, user_id: int) -> User:
         """Get or create a user by ID"""
         # First check the in-memory cache
-        if user_id in self.users:
-            return self.users[user_id]
+        user = self.users.get(user_id)
+        if user is not None:
+            self.users.move_to_end(user_id)
+            return user
         
         # Then try to load from the database
-        if self.db:
-            user_data = self.db.users.find_one({"id": user_id})
+        if self.db is not None:
+            user_data = await self.db.users.find_one({"id": user_id})
             if user_data:
                 # Convert MongoDB ObjectId to string
                 if "_id" in user_data:
                     user_data["_id"] = str(user_data["_id"])
                 
                 user = User.from_dict(user_data)
-                self.users[user_id] = user
+                self._last_saved[user_id] = user.to_dict()
+                self._cache_user(user)
                 return user
         
         # Create a new user if not found
         user = User(id=user_id)
-        self.users[user_id] = user
         
         # Save to database
-        self._save_user(user)
+        await self.update_user(user)
         
         return user
     
-    def update_user(self, user: User) -> bool:
-        """Update a user in the database"""
+    def _cache_user(self, user: User) -> None:
+        """Add a user to the in-memory cache, evicting the least recently used ones if full"""
         self.users[user.id] = user
-        return self._save_user(user)
+        self.users.move_to_end(user.id)
+        
+        # Without a database the cache is the only copy, so never evict
+        excess = len(self.users) - self._max_cached_users
+        if excess <= 0 or self.db is None:
+            return
+        
+        # Users with unflushed changes stay until they are written
+        pinned = self._dirty | self._flushing
+        candidates = islice(self.users, excess + len(pinned))
+        evicted = [user_id for user_id in candidates if user_id not in pinned][:excess]
+        for user_id in evicted:
+            del self.users[user_id]
+            self._last_saved.pop(user_id, None)
     
-    def _save_user(self, user: User) -> bool:
+    async def update_user(self, user: User) -> bool:
+        """Update a user in the database"""
+        self._cache_user(user)
+        
+        # Without the background flush, write straight through
+        if self._flush_task is None:
+            return await self._save_user(user)
+        
+        self._dirty.add(user.id)
+        return True
+    
+    def _changed_fields(self, user: User) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Serialize a user and return (document, fields changed since the last save)"""
+        user_dict = user.to_dict()
+        last_saved = self._last_saved.get(user.id, {})
+        changes = {key: value for key, value in user_dict.items() if last_saved.get(key) != value}
+        return user_dict, changes
+    
+    async def _save_user(self, user: User) -> bool:
         """Save a user to MongoDB"""
-        if not self.db:
+        if self.db is None:
             return False
         
         try:
-            user_dict = user.to_dict()
-            
-            # Ensure datetime objects are serialized properly
-            for key, value in user_dict.items():
-                if isinstance(value, datetime):
-                    user_dict[key] = value.isoformat()
+            user_dict, changes = self._changed_fields(user)
+            if not changes:
+                return True
             
-            self.db.users.update_one(
+            await self.db.users.update_one(
                 {"id": user.id},
-                {"$set": user_dict},
+                {"$set": changes},
                 upsert=True
             )
+            if user.id in self.users:
+                self._last_saved[user.id] = user_dict
             return True
         except Exception as e:
             logger.error(f"Error saving user {user.id}: {str(e)}")
             return False
     
-    def add_favorite(self, user_id: int, track_id: str) -> bool:
+    async def start(self) -> None:
+        """Prepare the users collection and start writing user changes in periodic batches"""
+        if self.db is None:
+            return
+        
+        # Every lookup and upsert filters on "id" (no-op if the index already exists)
+        try:
+            await self.db.users.create_index([("id", ASCENDING)], unique=True)
+        except Exception as e:
+            logger.error(f"Error creating users index: {str(e)}")
+        
+        if self._flush_task is None:
+            self._stop_flushing = asyncio.Event()
+            self._flush_task = asyncio.create_task(self._flush_loop())
+    
+    async def _flush_loop(self) -> None:
+        """Flush pending user changes every few seconds until asked to stop"""
+        while not self._stop_flushing.is_set():
+            try:
+                await asyncio.wait_for(self._stop_flushing.wait(), timeout=self._flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            
+            # Keep the loop alive through unexpected errors, the changes stay dirty for the next pass
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error in user flush loop: {str(e)}")
+    
+    async def flush(self) -> bool:
+        """Write all pending user changes to MongoDB in a single bulk write"""
+        if self.db is None or not self._dirty:
+            return True
+        
+        dirty, self._dirty = self._dirty, set()
+        self._flushing |= dirty
+        written = False
+        try:
+            ops = []
+            saved = {}
+            for user_id in dirty:
+                user = self.users.get(user_id)
+                if user is None:
+                    continue
+                
+                user_dict, changes = self._changed_fields(user)
+                if changes:
+                    ops.append(UpdateOne({"id": user_id}, {"$set": changes}, upsert=True))
+                    saved[user_id] = user_dict
+            
+            if ops:
+                await self.db.users.bulk_write(ops, ordered=False)
+                for user_id, user_dict in saved.items():
+                    # Evicted users no longer need their last saved document
+                    if user_id in self.users:
+                        self._last_saved[user_id] = user_dict
+            written = True
+            return True
+        except Exception as e:
+            logger.error(f"Error flushing {len(dirty)} users: {str(e)}")
+            return False
+        finally:
+            self._flushing -= dirty
+            # Retry on the next flush, including when cancelled mid-write
+            if not written:
+                self._dirty |= dirty
+    
+    async def close(self) -> None:
+        """Stop the background flush and write any pending changes"""
+        if self._flush_task is not None:
+            # Let the loop finish any write in progress rather than cancelling it
+            self._stop_flushing.set()
+            await self._flush_task
+            self._flush_task = None
+        
+        await self.flush()
+    
+    async def add_favorite(self, user_id: int, track_id: str) -> bool:
         """Add a track to user's favorites"""
-        user = self.get_user(user_id)
+        user = await self.get_user(user_id)
         user.add_to_favorites(track_id)
-        return self.update_user(user)
+        return await self.update_user(user)
     
-    def remove_favorite(self, user_id: int, track_id: str) -> bool:
+    async def remove_favorite(self, user_id: int, track_id: str) -> bool:
         """Remove a track from user's favorites"""
-        user = self.get_user(user_id)
+        user = await self.get_user(user_id)
         user.remove_from_favorites(track_id)
-        return self.update_user(user)
+        return await self.update_user(user)
     
-    def get_favorites(self, user_id: int) -> List[str]:
+    async def get_favorites(self, user_id: int) -> List[str]:
         """Get a user's favorite tracks"""
-        user = self.get_user(user_id)
+        user = await self.get_user(user_id)
         return user.favorite_tracks
     
-    def add_to_history(self, user_id: int, track_id: str) -> bool:
+    async def add_to_history(self, user_id: int, track_id: str) -> bool:
         """Add a track to user's history"""
-        user = self.get_user(user_id)
+        user = await self.get_user(user_id)
         user.add_to_history(track_id)
-        return self.update_user(user)
+        return await self.update_user(user)
     
-    def get_history(self, user_id: int, limit: int = 10) -> List[str]:
+    async def get_history(self, user_id: int, limit: int = 10) -> List[str]:
         """Get a user's listening history"""
-        user = self.get_user(user_id)
+        user = await self.get_user(user_id)
         return user.history[:limit]
     
-    def set_preference(self, user_id: int, key: str, value: Any) -> bool:
+    async def set_preference(self, user_id: int, key: str, value: Any) -> bool:
         """Set a user preference"""
-        user = self.get_user(user_id)
-        if not hasattr(user, "settings"):
-            user.settings = {}
-        
+        user = await self.get_user(user_id)
         user.settings[key] = value
-        return self.update_user(user)
+        return await self.update_user(user)
     
-    def get_preference(self, user_id: int, key: str, default: Any = None) -> Any:
+    async def get_preference(self, user_id: int, key: str, default: Any = None) -> Any:
         """Get a user preference"""
-        user = self.get_user(user_id)
-        if not hasattr(user, "settings") or key not in user.settings:
-            return default
-        
+        user = await self.get_user(user_id)
         return user.settings.get(key, default)
     
-    def update_last_active(self, user_id: int) -> bool:
+    async def update_last_active(self, user_id: int) -> bool:
         """Update a user's last active timestamp"""
-        user = self.get_user(user_id)
+        user = await self.get_user(user_id)
         user.update_last_active()
-        return self.update_user(user)
+        return await self.update_user(user)
     
-    def set_volume(self, user_id: int, volume: int) -> int:
+    async def set_volume(self, user_id: int, volume: int) -> int:
         """Set a user's preferred volume"""
         volume = max(0, min(100, volume))
-        user = self.get_user(user_id)
+        user = await self.get_user(user_id)
         user.volume = volume
-        self.update_user(user)
+        await self.update_user(user)
         return volume
     
-    def get_volume(self, user_id: int) -> int:
+    async def get_volume(self, user_id: int) -> int:
         """Get a user's preferred volume"""
-        user = self.get_user(user_id)
+        user = await self.get_user(user_id)
         return user.volume
     
-    def get_all_users(self) -> List[User]:
-        """Get all users (admin function)"""
-        if not self.db:
-            return list(self.users.values())
+    async def iter_all_users(self, projection: Optional[Dict[str, Any]] = None) -> AsyncIterator[User]:
+        """
+        Iterate over all users one at a time (admin function)
+        Pass a projection to only load the fields you need; "id" is always included
+        """
+        if self.db is None:
+            for user in list(self.users.values()):
+                yield user
+            return
         
-        try:
-            user_data = list(self.db.users.find())
-            users = []
-            
-            for data in user_data:
+        if projection is not None:
+            projection = {**projection, "id": 1}
+        
+        async for data in self.db.users.find({}, projection):
+            # Cached users may have changes that aren't written yet
+            user = self.users.get(data["id"])
+            if user is None:
                 # Convert MongoDB ObjectId to string
                 if "_id" in data:
                     data["_id"] = str(data["_id"])
                 
+                # Not added to the cache, to keep it to recently active users
                 user = User.from_dict(data)
-                # Update cache
-                self.users[user.id] = user
-                users.append(user)
-            
-            return users
+            yield user
+    
+    async def get_all_users(self, projection: Optional[Dict[str, Any]] = None) -> List[User]:
+        """Get all users (admin function)"""
+        try:
+            return [user async for user in self.iter_all_users(projection)]
         except Exception as e:
             logger.error(f"Error getting all users: {str(e)}")
-            return list(self.users.values()) 
\ No newline at end of file
+            return list(self.users.values())
@@ -2,21 +2,56 @@ import logging
 import os
 import asyncio
 import tempfile
-from typing import Optional, Tuple
+import shutil
+from pathlib import Path
+from typing import List, Optional, Tuple
 import aiohttp
-from pydub import AudioSegment
-import uuid
+import aiofiles
+import hashlib
+import secrets
+import string
 
 logger = logging.getLogger(__name__)
 
+# Characters that are never percent-encoded in a URL query value
+_UNRESERVED_CHARS = frozenset(string.ascii_letters + string.digits + "-._~")
+
+
+def _truncate_url_encoded(text: str, max_bytes: int) -> str:
+    """Cut text so it fits in max_bytes once URL-encoded, assuming every reserved character is percent-encoded"""
+    size = 0
+    for i, char in enumerate(text):
+        size += 1 if char in _UNRESERVED_CHARS else 3 * len(char.encode("utf-8", "surrogatepass"))
+        if size > max_bytes:
+            return text[:i]
+    return text
+
+
 class VoiceService:
     def __init__(self, downloads_path: str = "./downloads"):
         """Initialize the voice service"""
         self.downloads_path = downloads_path
+        self._downloads = Path(downloads_path)
+        self._session: Optional[aiohttp.ClientSession] = None
+        
+        # Run at most one single-threaded ffmpeg per core, so concurrent jobs don't oversubscribe the CPU
+        self._ffmpeg_sema = asyncio.Semaphore(max(1, os.cpu_count() or 2))
         
         # Create the downloads directory if it doesn't exist
-        if not os.path.exists(downloads_path):
-            os.makedirs(downloads_path)
+        self._downloads.mkdir(parents=True, exist_ok=True)
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Get the shared HTTP session, creating it on first use"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=50, ttl_dns_cache=300, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+    
+    async def close(self) -> None:
+        """Close the shared HTTP session"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
     
     async def text_to_speech(self, text: str, lang: str = "en") -> Optional[str]:
         """
@@ -28,61 +63,99 @@ class VoiceService:
         if not text:
             return None
         
-        # Limit text length to prevent abuse
-        if len(text) > 200:
-            text = text[:200]
+        # Google rejects queries over 200 bytes once URL-encoded, which also prevents abuse
+        text = _truncate_url_encoded(text[:200], 200)
         
-        # Generate a unique filename
-        filename = f"tts_{uuid.uuid4()}.mp3"
-        file_path = os.path.join(self.downloads_path, filename)
+        # Name the file after a hash of its inputs, so repeated prompts reuse the earlier audio
+        digest = hashlib.blake2b(f"{lang}|{text}".encode(), digest_size=16).hexdigest()
+        filename = f"tts_{digest}.mp3"
+        file_path = str(self._downloads / filename)
+        temp_path = None
         
         try:
+            if await asyncio.to_thread(os.path.exists, file_path):
+                return file_path
+            
             # Google Translate TTS endpoint (not official API)
-            url = f"https://translate.google.com/translate_tts?ie=UTF-8&client=tw-ob&tl={lang}&q={text}"
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    if response.status != 200:
-                        logger.error(f"Error fetching TTS: {response.status}")
-                        return None
-                    
-                    data = await response.read()
-                    
-                    # Save the audio file
-                    with open(file_path, "wb") as f:
-                        f.write(data)
-                    
-                    return file_path
+            url = "https://translate.google.com/translate_tts"
+            params = {"ie": "UTF-8", "client": "tw-ob", "tl": lang, "q": text}
+            
+            session = await self._get_session()
+            async with session.get(url, params=params, timeout=aiohttp.ClientTimeout(total=10)) as response:
+                if response.status != 200:
+                    logger.error(f"Error fetching TTS: {response.status}")
+                    return None
+                
+                # Stream the audio file to disk without blocking the event loop
+                # Written under a unique temporary name, so an interrupted download is never served from the cache
+                # and concurrent requests for the same text don't write into the same file
+                temp_path = f"{file_path}.{secrets.token_hex(8)}.part"
+                async with aiofiles.open(temp_path, "wb") as f:
+                    async for chunk in response.content.iter_chunked(64 * 1024):
+                        await f.write(chunk)
+                
+                await asyncio.to_thread(os.replace, temp_path, file_path)
+                temp_path = None
+                return file_path
         
         except Exception as e:
             logger.error(f"Error generating TTS: {str(e)}")
             return None
+        
+        finally:
+            # Remove the partial download if the request failed, timed out or was cancelled
+            if temp_path is not None:
+                try:
+                    await asyncio.to_thread(os.unlink, temp_path)
+                except OSError:
+                    pass
+    
+    async def text_to_speech_batch(self, items: List[Tuple[str, str]]) -> List[Optional[str]]:
+        """Convert several (text, lang) pairs to speech concurrently, returning file paths in the same order"""
+        # Cap concurrent requests so a long batch doesn't flood the TTS endpoint
+        semaphore = asyncio.Semaphore(8)
+        
+        async def convert(text: str, lang: str) -> Optional[str]:
+            async with semaphore:
+                return await self.text_to_speech(text, lang)
+        
+        # Identical items share one request and one cached file
+        unique_items = list(dict.fromkeys(items))
+        paths = await asyncio.gather(*(convert(text, lang) for text, lang in unique_items))
+        results = dict(zip(unique_items, paths))
+        
+        return [results[item] for item in items]
+    
+    async def _run_ffmpeg(self, *args: str) -> Tuple[int, bytes]:
+        """Run ffmpeg with the given arguments and return its exit code and stderr"""
+        async with self._ffmpeg_sema:
+            # Exec ffmpeg directly, so no shell is spawned and paths need no quoting
+            process = await asyncio.create_subprocess_exec(
+                "ffmpeg", *args,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            
+            stdout, stderr = await process.communicate()
+            return process.returncode, stderr
     
     async def extract_audio(self, video_path: str) -> Optional[str]:
         """Extract audio from a video file"""
-        if not os.path.exists(video_path):
+        if not await asyncio.to_thread(os.path.exists, video_path):
             logger.error(f"Video file does not exist: {video_path}")
             return None
         
         try:
             # Generate output filename
-            filename = os.path.basename(video_path)
-            base_name = os.path.splitext(filename)[0]
-            output_path = os.path.join(self.downloads_path, f"{base_name}.mp3")
+            base_name = Path(video_path).stem
+            output_path = str(self._downloads / f"{base_name}.mp3")
             
             # Use ffmpeg to extract audio
-            cmd = f"ffmpeg -i \"{video_path}\" -q:a 0 -map a \"{output_path}\" -y"
-            
-            # Run the command
-            process = await asyncio.create_subprocess_shell(
-                cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
+            returncode, stderr = await self._run_ffmpeg(
+                "-i", video_path, "-q:a", "0", "-map", "a", "-threads", "1", output_path, "-y"
             )
             
-            stdout, stderr = await process.communicate()
-            
-            if process.returncode != 0:
+            if returncode != 0:
                 logger.error(f"Error extracting audio: {stderr.decode()}")
                 return None
             
@@ -94,7 +167,7 @@ class VoiceService:
     
     async def speed_change(self, audio_path: str, speed: float = 1.0) -> Optional[str]:
         """Change the speed of an audio file"""
-        if not os.path.exists(audio_path):
+        if not await asyncio.to_thread(os.path.exists, audio_path):
             logger.error(f"Audio file does not exist: {audio_path}")
             return None
         
@@ -103,21 +176,30 @@ class VoiceService:
             return None
         
         try:
-            # Load the audio file
-            sound = AudioSegment.from_file(audio_path)
-            
             # Generate output filename
-            filename = os.path.basename(audio_path)
-            base_name, ext = os.path.splitext(filename)
-            output_path = os.path.join(self.downloads_path, f"{base_name}_speed{speed}{ext}")
+            path = Path(audio_path)
+            output_path = str(self._downloads / f"{path.stem}_speed{speed}{path.suffix}")
             
-            # Change the speed
-            sound_with_altered_frame_rate = sound._spawn(sound.raw_data, overrides={
-                "frame_rate": int(sound.frame_rate * speed)
-            })
+            # atempo only accepts 0.5-2.0, so chain filters for speeds outside that range
+            tempos = []
+            remaining = speed
+            while remaining > 2.0:
+                tempos.append(2.0)
+                remaining /= 2.0
+            while remaining < 0.5:
+                tempos.append(0.5)
+                remaining /= 0.5
+            tempos.append(remaining)
+            atempo = ",".join(f"atempo={tempo}" for tempo in tempos)
             
-            # Export the audio file
-            sound_with_altered_frame_rate.export(output_path, format=ext.strip('.'))
+            # Use ffmpeg to change the tempo without decoding the audio in Python
+            returncode, stderr = await self._run_ffmpeg(
+                "-i", audio_path, "-filter:a", atempo, "-vn", "-threads", "1", output_path, "-y"
+            )
+            
+            if returncode != 0:
+                logger.error(f"Error changing audio speed: {stderr.decode()}")
+                return None
             
             return output_path
         
@@ -127,7 +209,7 @@ class VoiceService:
     
     async def convert_audio_format(self, audio_path: str, format: str = "mp3") -> Optional[str]:
         """Convert an audio file to a different format"""
-        if not os.path.exists(audio_path):
+        if not await asyncio.to_thread(os.path.exists, audio_path):
             logger.error(f"Audio file does not exist: {audio_path}")
             return None
         
@@ -137,23 +219,13 @@ class VoiceService:
         
         try:
             # Generate output filename
-            filename = os.path.basename(audio_path)
-            base_name = os.path.splitext(filename)[0]
-            output_path = os.path.join(self.downloads_path, f"{base_name}.{format}")
+            base_name = Path(audio_path).stem
+            output_path = str(self._downloads / f"{base_name}.{format}")
             
             # Use ffmpeg to convert the audio
-            cmd = f"ffmpeg -i \"{audio_path}\" \"{output_path}\" -y"
-            
-            # Run the command
-            process = await asyncio.create_subprocess_shell(
-                cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            stdout, stderr = await process.communicate()
+            returncode, stderr = await self._run_ffmpeg("-i", audio_path, "-threads", "1", output_path, "-y")
             
-            if process.returncode != 0:
+            if returncode != 0:
                 logger.error(f"Error converting audio format: {stderr.decode()}")
                 return None
             
@@ -163,6 +235,47 @@ class VoiceService:
             logger.error(f"Error converting audio format: {str(e)}")
             return None
     
+    @staticmethod
+    def _write_concat_list(audio_paths: list) -> str:
+        """Write an ffmpeg concat list for the given files to a temporary file and return its path"""
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".txt", delete=False) as f:
+            for path in audio_paths:
+                f.write(f"file '{os.path.abspath(path)}'\n")
+            return f.name
+    
+    async def _concat_audio(self, audio_paths: list, output_path: str) -> bool:
+        """Concatenate audio files that share a codec without re-encoding them"""
+        # Create a temporary file for the file list
+        temp_file = await asyncio.to_thread(self._write_concat_list, audio_paths)
+        
+        try:
+            # Use ffmpeg to merge the files
+            returncode, stderr = await self._run_ffmpeg(
+                "-f", "concat", "-safe", "0", "-i", temp_file, "-c", "copy", "-threads", "1", output_path, "-y"
+            )
+        finally:
+            # Remove the temporary file
+            await asyncio.to_thread(os.unlink, temp_file)
+        
+        if returncode != 0:
+            logger.error(f"Error merging audio files: {stderr.decode()}")
+            return False
+        
+        return True
+    
+    async def _normalize_audio(self, audio_path: str, output_path: str) -> bool:
+        """Re-encode an audio file to MP3 with a fixed sample rate and channel layout"""
+        returncode, stderr = await self._run_ffmpeg(
+            "-i", audio_path, "-vn", "-ar", "44100", "-ac", "2",
+            "-c:a", "libmp3lame", "-q:a", "2", "-threads", "1", output_path, "-y"
+        )
+        
+        if returncode != 0:
+            logger.error(f"Error normalizing audio file {audio_path}: {stderr.decode()}")
+            return False
+        
+        return True
+    
     async def merge_audio_files(self, audio_paths: list, output_name: str = "merged") -> Optional[str]:
         """Merge multiple audio files into one"""
         if not audio_paths:
@@ -170,39 +283,34 @@ class VoiceService:
             return None
         
         try:
-            # Check if all files exist
-            for path in audio_paths:
-                if not os.path.exists(path):
+            # Check if all files exist, without blocking the event loop
+            exists = await asyncio.gather(*(asyncio.to_thread(os.path.exists, path) for path in audio_paths))
+            for path, found in zip(audio_paths, exists):
+                if not found:
                     logger.error(f"Audio file does not exist: {path}")
                     return None
             
-            # Create a temporary file for the file list
-            with tempfile.NamedTemporaryFile(mode="w", suffix=".txt", delete=False) as f:
-                for path in audio_paths:
-                    f.write(f"file '{os.path.abspath(path)}'\n")
-                temp_file = f.name
-            
             # Generate output filename
-            output_path = os.path.join(self.downloads_path, f"{output_name}.mp3")
+            output_path = str(self._downloads / f"{output_name}.mp3")
             
-            # Use ffmpeg to merge the files
-            cmd = f"ffmpeg -f concat -safe 0 -i \"{temp_file}\" -c copy \"{output_path}\" -y"
+            # MP3 inputs can usually be joined as-is
+            if all(path.lower().endswith(".mp3") for path in audio_paths):
+                if await self._concat_audio(audio_paths, output_path):
+                    return output_path
             
-            # Run the command
-            process = await asyncio.create_subprocess_shell(
-                cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            stdout, stderr = await process.communicate()
-            
-            # Remove the temporary file
-            os.unlink(temp_file)
-            
-            if process.returncode != 0:
-                logger.error(f"Error merging audio files: {stderr.decode()}")
-                return None
+            # Otherwise re-encode every input to matching MP3s in parallel, then join those
+            temp_dir = await asyncio.to_thread(tempfile.mkdtemp)
+            try:
+                normalized_paths = [os.path.join(temp_dir, f"{i}.mp3") for i in range(len(audio_paths))]
+                results = await asyncio.gather(*(
+                    self._normalize_audio(path, normalized_path)
+                    for path, normalized_path in zip(audio_paths, normalized_paths)
+                ))
+                
+                if not all(results) or not await self._concat_audio(normalized_paths, output_path):
+                    return None
+            finally:
+                await asyncio.to_thread(shutil.rmtree, temp_dir, ignore_errors=True)
             
             return output_path
         
@@ -1,4 +1,5 @@
 import re
+import functools
 from typing import Union, Optional
 
 
@@ -9,7 +10,14 @@ def format_duration(seconds: Union[int, float]) -> str:
     if not seconds or seconds < 0:
         return "00:00"
     
-    seconds = int(seconds)
+    return _fmt_duration_int(int(seconds))
+
+
+@functools.lru_cache(maxsize=4096)
+def _fmt_duration_int(seconds: int) -> str:
+    """
+    Format a whole number of seconds, cached since track lengths repeat across queue listings
+    """
     minutes, seconds = divmod(seconds, 60)
     hours, minutes = divmod(minutes, 60)
     
@@ -26,15 +34,19 @@ def format_filesize(bytes: Union[int, float]) -> str:
     if not bytes or bytes < 0:
         return "0 B"
     
+    size = int(bytes)
+    
     units = ["B", "KB", "MB", "GB", "TB"]
-    size = float(bytes)
-    unit_index = 0
     
-    while size >= 1024 and unit_index < len(units) - 1:
-        size /= 1024.0
-        unit_index += 1
+    # Each unit is 2^10 times the last, so the bit length gives the unit directly
+    unit_index = min(max(size.bit_length() - 1, 0) // 10, len(units) - 1)
     
-    return f"{size:.2f} {units[unit_index]}"
+    return f"{size / (1 << (10 * unit_index)):.2f} {units[unit_index]}"
+
+
+# Characters to escape: _ * [ ] ( ) ~ ` > # + - = | { } . !
+_MD_TRANS = str.maketrans({char: f'\\{char}' for char in r'_*[]()~`>#+-=|{}.!'})
+_MD_SPECIAL_RE = re.compile(r'[_*\[\]()~`>#+\-=|{}.!]')
 
 
 def escape_markdown(text: str) -> str:
@@ -44,12 +56,8 @@ def escape_markdown(text: str) -> str:
     if not text:
         return ""
     
-    # Characters to escape: _ * [ ] ( ) ~ ` > # + - = | { } . !
-    escape_chars = r'_*[]()~`>#+-=|{}.!'
-    for char in escape_chars:
-        text = text.replace(char, f'\\{char}')
-    
-    return text
+    # Escape every special character in a single pass
+    return text.translate(_MD_TRANS)
 
 
 def format_message(message: str, markdown: bool = True) -> str:
@@ -63,7 +71,8 @@ def format_message(message: str, markdown: bool = True) -> str:
     if len(message) > 4096:
         message = message[:4093] + "..."
     
-    if markdown:
+    # Most messages have nothing to escape, so only rewrite the ones that do
+    if markdown and _MD_SPECIAL_RE.search(message):
         message = escape_markdown(message)
     
     return message
@@ -86,6 +95,11 @@ def truncate_text(text: str, max_length: int = 100, add_ellipsis: bool = True) -
     return truncated
 
 
+# Characters that are invalid in filenames, and runs of whitespace
+_FILENAME_DELETE = str.maketrans('', '', '\\/*?:"<>|')
+_WS_RE = re.compile(r'\s+')
+
+
 def clean_filename(filename: str) -> str:
     """
     Clean a filename to make it safe for saving files
@@ -94,10 +108,10 @@ def clean_filename(filename: str) -> str:
         return "unnamed"
     
     # Remove invalid characters for filenames
-    filename = re.sub(r'[\\/*?:"<>|]', "", filename)
+    filename = filename.translate(_FILENAME_DELETE)
     
     # Replace multiple spaces with a single space
-    filename = re.sub(r'\s+', " ", filename).strip()
+    filename = _WS_RE.sub(" ", filename).strip()
     
     # Ensure the filename is not too long
     if len(filename) > 200:
@@ -2,17 +2,28 @@ import re
 from typing import Union, Optional, Tuple
 
 
+# Generic URL pattern, compiled once at import
+_URL_RE = re.compile(
+    r'^(?:http|ftp)s?://'  # http:// or https://
+    r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+(?:[A-Z]{2,6}\.?|[A-Z0-9-]{2,}\.?)|'  # domain
+    r'localhost|'  # localhost
+    r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})'  # IP
+    r'(?::\d+)?'  # optional port
+    r'(?:/?|[/?]\S+)', re.IGNORECASE)
+
+
 def validate_url(url: str) -> bool:
     """Check if a string is a valid URL"""
-    url_pattern = re.compile(
-        r'^(?:http|ftp)s?://'  # http:// or https://
-        r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+(?:[A-Z]{2,6}\.?|[A-Z0-9-]{2,}\.?)|'  # domain
-        r'localhost|'  # localhost
-        r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})'  # IP
-        r'(?::\d+)?'  # optional port
-        r'(?:/?|[/?]\S+)$', re.IGNORECASE)
-    
-    return bool(url_pattern.match(url))
+    return bool(_URL_RE.fullmatch(url))
+
+
+# YouTube video URL forms combined into one pattern, so a single match checks them all
+_YT_RE = re.compile(
+    r'^https?://(?:'
+    r'(?:www\.)?youtube\.com/watch\?v=([a-zA-Z0-9_-]{11})(?:&.*)?|'  # Regular YouTube URL
+    r'youtu\.be/([a-zA-Z0-9_-]{11})(?:\?.*)?|'  # Short YouTube URL
+    r'(?:www\.)?youtube\.com/(?:embed|shorts)/([a-zA-Z0-9_-]{11})(?:\?.*)?'  # Embed URL or YouTube Shorts
+    r')')
 
 
 def validate_youtube_url(url: str) -> Tuple[bool, Optional[str]]:
@@ -20,54 +31,55 @@ def validate_youtube_url(url: str) -> Tuple[bool, Optional[str]]:
     Check if a URL is a valid YouTube URL and extract the video ID
     Returns (is_valid, video_id)
     """
-    patterns = [
-        r'^https?://(?:www\.)?youtube\.com/watch\?v=([a-zA-Z0-9_-]{11})(?:&.*)?$',  # Regular YouTube URL
-        r'^https?://youtu\.be/([a-zA-Z0-9_-]{11})(?:\?.*)?$',  # Short YouTube URL
-        r'^https?://(?:www\.)?youtube\.com/embed/([a-zA-Z0-9_-]{11})(?:\?.*)?$',  # Embed URL
-        r'^https?://(?:www\.)?youtube\.com/shorts/([a-zA-Z0-9_-]{11})(?:\?.*)?$',  # YouTube Shorts
-    ]
+    # Cheap check before running any regex
+    if 'youtu' not in url:
+        return False, None
     
-    for pattern in patterns:
-        match = re.match(pattern, url)
-        if match:
-            return True, match.group(1)
+    match = _YT_RE.fullmatch(url)
+    if match:
+        # Only the group of the form that matched is set
+        return True, match.group(match.lastindex)
     
     return False, None
 
 
+# Spotify URL pattern, capturing the content type and ID
+_SPOTIFY_RE = re.compile(
+    r'^https?://open\.spotify\.com/(?P<type>track|album|playlist|artist)/(?P<id>[a-zA-Z0-9]{22})(?:\?.*)?'
+)
+
+
 def validate_spotify_url(url: str) -> Tuple[bool, Optional[str], Optional[str]]:
     """
     Check if a URL is a valid Spotify URL and extract the track/album/playlist ID
     Returns (is_valid, content_type, content_id)
     """
-    patterns = {
-        'track': r'^https?://open\.spotify\.com/track/([a-zA-Z0-9]{22})(?:\?.*)?$',
-        'album': r'^https?://open\.spotify\.com/album/([a-zA-Z0-9]{22})(?:\?.*)?$',
-        'playlist': r'^https?://open\.spotify\.com/playlist/([a-zA-Z0-9]{22})(?:\?.*)?$',
-        'artist': r'^https?://open\.spotify\.com/artist/([a-zA-Z0-9]{22})(?:\?.*)?$',
-    }
+    # Cheap check before running any regex
+    if 'open.spotify.com' not in url:
+        return False, None, None
     
-    for content_type, pattern in patterns.items():
-        match = re.match(pattern, url)
-        if match:
-            return True, content_type, match.group(1)
+    match = _SPOTIFY_RE.fullmatch(url)
+    if match:
+        return True, match.group('type'), match.group('id')
     
     return False, None, None
 
 
+# YouTube playlist URL forms (regular playlist URL or video in playlist), compiled once at import
+_YT_PLAYLIST_RE = re.compile(
+    r'^https?://(?:www\.)?youtube\.com/'
+    r'(?:playlist\?list=|watch\?v=[a-zA-Z0-9_-]{11}&list=)'
+    r'([a-zA-Z0-9_-]+)(?:&.*)?'
+)
+
+
 def validate_youtube_playlist_url(url: str) -> Tuple[bool, Optional[str]]:
     """
     Check if a URL is a valid YouTube playlist URL and extract the playlist ID
     Returns (is_valid, playlist_id)
     """
-    patterns = [
-        r'^https?://(?:www\.)?youtube\.com/playlist\?list=([a-zA-Z0-9_-]+)(?:&.*)?$',  # Regular playlist URL
-        r'^https?://(?:www\.)?youtube\.com/watch\?v=[a-zA-Z0-9_-]{11}&list=([a-zA-Z0-9_-]+)(?:&.*)?$',  # Video in playlist
-    ]
-    
-    for pattern in patterns:
-        match = re.match(pattern, url)
-        if match:
-            return True, match.group(1)
+    match = _YT_PLAYLIST_RE.fullmatch(url)
+    if match:
+        return True, match.group(1)
     
     return False, None